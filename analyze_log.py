@@ -1,10 +1,232 @@
 import os
 import re
 import sys
+import gzip
 import json
+import math
+import mmap
+import time
+import zlib
+import queue
+import hashlib
+import threading
+import tempfile
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+try:
+    import aiohttp  # optional, für das parallele Abrufen mehrerer Logs
+except ImportError:
+    aiohttp = None
+
+try:
+    import orjson  # optional, deutlich schneller als das json-Modul
+except ImportError:
+    orjson = None
+
+try:
+    import ahocorasick  # optional, Schwärzen vieler Schlüsselwörter in einem Durchlauf
+except ImportError:
+    ahocorasick = None
+
+try:
+    # optional: RE2 garantiert lineare Laufzeit, auch bei präparierten Log-Zeilen
+    import re2 as _regex
+except ImportError:
+    _regex = re
+
+# Eine Session pro Thread, damit Verbindungen zu Jenkins und OpenAI wiederverwendet
+# werden. requests.Session ist nicht als thread-sicher dokumentiert, daher keine
+# gemeinsame Session für die Threads von BuildAnalyzer.run_analysis_many.
+_THREAD_LOCAL = threading.local()
+
+
+def _session() -> requests.Session:
+    """
+    Liefert die Session des aktuellen Threads und legt sie bei Bedarf an.
+    """
+    session = getattr(_THREAD_LOCAL, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _THREAD_LOCAL.session = session
+    return session
+
+
+def _json_dumps(obj) -> bytes:
+    """
+    Serialisiert obj als UTF-8-kodiertes JSON (mit orjson, falls verfügbar).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: bytes):
+    """
+    Parst JSON aus bytes (mit orjson, falls verfügbar).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Fehlerschlagwörter, an denen relevante Log-Zeilen erkannt werden
+_ERROR_KEYWORDS = ("error", "exception", "failed", "traceback")
+# Schlüsselwörter, ab denen eine Zeile bis zum nächsten Leerzeichen geschwärzt wird
+_SECRET_KEYWORDS = ("password", "token")
+
+# Regex-Muster einmalig beim Laden des Moduls kompilieren.
+# Flags stehen inline im Muster, damit sie mit re und re2 gleich funktionieren.
+# Alle Zeichen, für die str.isspace() gilt. \S ist bei RE2 nur ASCII, bei re Unicode;
+# die explizite Klasse sorgt dafür, dass ein Secret mit beiden Engines gleich endet.
+_NON_SPACE = "[^\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]"
+_SECRET_RE = _regex.compile(r"(?i)(%s)" % "|".join(_SECRET_KEYWORDS) + _NON_SPACE + "*")
+# Fehlerschlagwörter direkt im (bytes-)Log finden, die Zeilengrenzen liefert rfind/find
+_ERROR_BYTES_RE = _regex.compile(rb"(?i)%s" % "|".join(_ERROR_KEYWORDS).encode("ascii"))
+_NON_SPACE_RE = _regex.compile(_NON_SPACE + "*")
+# Serialisierte ConsoleNotes im Log-File auf der Platte (consoleText entfernt sie)
+_CONSOLE_NOTE_PREAMBLE = "\x1b[8mha:"
+_CONSOLE_NOTE_RE = _regex.compile(r"\x1b\[8mha:.*?\x1b\[0m")
+# Dauerangaben aus x-ratelimit-reset-* wie "20ms", "1s" oder "6m0s"
+_RESET_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_RESET_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+# Variable Anteile (Zeitstempel, Temp-Pfade, Hashes, Zahlen) für den Cache-Schlüssel vereinheitlichen
+_CACHE_NORMALIZE_RES = (
+    (_regex.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z?"), "<TS>"),
+    (_regex.compile(r"/tmp/[^\s]+"), "<TMP>"),
+    (_regex.compile(r"\b[0-9a-f]{7,40}\b"), "<HASH>"),
+    (_regex.compile(r"\b\d+\b"), "<N>"),
+)
+
+# Aho-Corasick-Automat: findet alle Schlüsselwörter in O(n), unabhängig von deren Anzahl
+if ahocorasick is not None:
+    _SECRET_AUTOMATON = ahocorasick.Automaton()
+    for _keyword in _SECRET_KEYWORDS:
+        _SECRET_AUTOMATON.add_word(_keyword, len(_keyword))
+    _SECRET_AUTOMATON.make_automaton()
+else:
+    _SECRET_AUTOMATON = None
+
+# İ und ı trifft re.IGNORECASE als "i", casefold() aber nicht
+_DOTTED_I_TABLE = {0x130: "i", 0x131: "i"}
+
+
+def _tail_offset(text: Union[str, bytes, mmap.mmap], n: int) -> int:
+    """
+    Liefert den Offset, ab dem die letzten n Zeilen von text beginnen.
+    Läuft per rfind rückwärts, ohne das Log in Zeilen aufzuteilen.
+    """
+    if n <= 0:
+        return len(text)
+    newline = "\n" if isinstance(text, str) else b"\n"
+    pos = len(text)
+    if text[-1:] == newline:
+        pos -= 1
+    for _ in range(n):
+        pos = text.rfind(newline, 0, pos)
+        if pos == -1:
+            return 0
+    return pos + 1
+
+
+def _normalize_for_cache(text: str) -> str:
+    """
+    Entfernt build-spezifische Anteile, damit gleiche Fehler
+    aus verschiedenen Builds denselben Cache-Schlüssel ergeben.
+    """
+    for pattern, replacement in _CACHE_NORMALIZE_RES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _fold_case(line: str) -> str:
+    """
+    Normalisiert die Groß-/Kleinschreibung so, dass ein Teilstring-Vergleich
+    mit den Schlüsselwörtern dieselben Zeilen trifft wie re.IGNORECASE
+    (z.B. "ſ" als "s").
+    """
+    if line.isascii():
+        return line.lower()
+    return line.translate(_DOTTED_I_TABLE).casefold()
+
+
+def _redact_secrets(line: str, folded: Optional[str] = None) -> str:
+    """
+    Ersetzt vertrauliche Daten (Schlüsselwort bis zum nächsten Leerzeichen)
+    durch [REDACTED]. Nutzt den Aho-Corasick-Automaten, falls verfügbar.
+    folded: bereits berechnetes _fold_case(line), falls vorhanden
+    """
+    if folded is None:
+        folded = _fold_case(line)
+    # casefold() kann bei einzelnen Unicode-Zeichen die Länge ändern, dann passen die Offsets nicht
+    if _SECRET_AUTOMATON is None or len(folded) != len(line):
+        if not any(keyword in folded for keyword in _SECRET_KEYWORDS):
+            return line
+        return _SECRET_RE.sub("[REDACTED]", line)
+
+    starts = sorted(end_index - length + 1 for end_index, length in _SECRET_AUTOMATON.iter(folded))
+    if not starts:
+        return line
+
+    spans = []
+    pos = 0
+    for start in starts:
+        # Treffer innerhalb eines bereits geschwärzten Bereichs überspringen
+        if start < pos:
+            continue
+        pos = _NON_SPACE_RE.match(line, start).end()
+        spans.append((start, pos))
+    return _redact_spans(line, spans)
+
+
+def _strip_console_notes(line: str) -> str:
+    """
+    Entfernt Jenkins-ConsoleNotes (ESC[8mha:<base64>ESC[0m) aus einer Zeile,
+    so wie es consoleText beim Abruf über HTTP tut.
+    """
+    if _CONSOLE_NOTE_PREAMBLE not in line:
+        return line
+    return _CONSOLE_NOTE_RE.sub("", line)
+
+
+def _filter_error_line(line: str) -> Optional[str]:
+    """
+    Gibt die bereinigte Zeile zurück, wenn sie ein Fehlerschlagwort enthält,
+    sonst None. Vertrauliche Daten werden dabei durch [REDACTED] ersetzt.
+    """
+    # Einmal lower()/casefold() und einfache Teilstring-Suche ist schneller als eine
+    # Regex mit IGNORECASE für jede Zeile
+    folded = _fold_case(line)
+    if not any(keyword in folded for keyword in _ERROR_KEYWORDS):
+        return None
+
+    # Beispiel-Filtern vertraulicher Daten
+    return _redact_secrets(line, folded).strip()
+
+
+def _redact_spans(line: str, spans: list) -> str:
+    """
+    Ersetzt die angegebenen (start, end)-Bereiche einer Zeile durch [REDACTED].
+    """
+    parts = []
+    pos = 0
+    for start, end in spans:
+        parts.append(line[pos:start])
+        parts.append("[REDACTED]")
+        pos = end
+    parts.append(line[pos:])
+    return "".join(parts)
+
+
 class JenkinsLogFetcher:
     """
     Diese Klasse kümmert sich darum, das Console-Log eines Jenkins-Jobs
@@ -25,45 +247,331 @@ class JenkinsLogFetcher:
         self.user = jenkins_user
         self.token = jenkins_api_token
 
-    def get_console_log(self) -> str:
+    def _console_url(self) -> str:
+        # Normalerweise: https://<jenkins>/job/<JOB_NAME>/<BUILD_NUMBER>/consoleText
+        return f"{self.base_url}/job/{self.job_name}/{self.build_number}/consoleText"
+
+    def _open_local_log(self) -> Union[bytes, mmap.mmap, None]:
         """
-        Ruft das Console-Log von Jenkins ab und gibt es als String zurück.
+        Liegt das Log bereits im Dateisystem (z. B. auf dem Jenkins-Controller),
+        wird es per mmap eingebunden statt über HTTP geladen.
+        Der Pfad kommt aus LOCAL_LOG_PATH_TEMPLATE, z. B.
+        '/var/jenkins_home/jobs/{job}/builds/{build}/log'.
+        Komprimierte Logs (log.gz) werden entpackt und als bytes zurückgegeben.
         """
-        # Normalerweise: https://<jenkins>/job/<JOB_NAME>/<BUILD_NUMBER>/consoleText
-        console_url = f"{self.base_url}/job/{self.job_name}/{self.build_number}/consoleText"
+        path_template = os.getenv("LOCAL_LOG_PATH_TEMPLATE")
+        if not path_template:
+            return None
+        log_path = path_template.format(job=self.job_name, build=self.build_number)
+        gz_path = log_path if log_path.endswith(".gz") else log_path + ".gz"
 
         try:
-            # GET-Request mit Basic Auth
-            response = requests.get(console_url, auth=HTTPBasicAuth(self.user, self.token), timeout=30)
+            if log_path != gz_path and os.path.isfile(log_path):
+                with open(log_path, "rb") as log_file:
+                    # Leere Dateien lassen sich nicht mappen
+                    if os.fstat(log_file.fileno()).st_size == 0:
+                        return b""
+                    return mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.isfile(gz_path):
+                log_path = gz_path
+                with gzip.open(gz_path, "rb") as log_file:
+                    return log_file.read()
+            return None
+        except (OSError, EOFError, ValueError, zlib.error) as os_err:
+            print(f"Konnte lokales Log {log_path} nicht lesen, nutze HTTP: {os_err}", file=sys.stderr)
+            return None
+
+    def get_console_log(self) -> Union[Iterator[str], bytes, mmap.mmap, None]:
+        """
+        Ruft das Console-Log von Jenkins ab und gibt es zeilenweise als
+        Iterator zurück, während der Download noch läuft.
+        Ist das Log lokal vorhanden, wird es stattdessen als mmap zurückgegeben.
+        Gibt None zurück, wenn das Log nicht abgerufen werden konnte.
+        """
+        local_log = self._open_local_log()
+        if local_log is not None:
+            return local_log
+
+        console_url = self._console_url()
+
+        response = None
+        try:
+            # GET-Request mit Basic Auth, Body wird erst beim Iterieren gelesen
+            response = _session().get(
+                console_url,
+                auth=HTTPBasicAuth(self.user, self.token),
+                stream=True,
+                timeout=30
+            )
             response.raise_for_status()
-            return response.text
         except requests.exceptions.RequestException as req_err:
             print(f"Fehler beim Abrufen des Jenkins-Logs: {req_err}", file=sys.stderr)
-            return ""
+            if response is not None:
+                response.close()
+            return None
+
+        # Jenkins liefert consoleText als UTF-8, eine Zeichensatz-Erkennung ist unnötig
+        response.encoding = "utf-8"
+        return self._iter_lines(response)
+
+    @staticmethod
+    def _iter_lines(response: requests.Response) -> Iterator[str]:
+        """
+        Liefert die Zeilen der gestreamten Antwort und schließt sie danach.
+        Bricht der Download ab, wird der Fehler weitergereicht, damit kein
+        unvollständiges Log analysiert wird. Getrennt wird wie im bytes-Pfad des LogParser nur an \\n (iter_lines
+        würde über splitlines() auch an einzelnen \\r trennen).
+        """
+        with response:
+            try:
+                pending = ""
+                for chunk in response.iter_content(chunk_size=65536, decode_unicode=True):
+                    lines = (pending + chunk).split("\n")
+                    pending = lines.pop()
+                    yield from lines
+                if pending:
+                    yield pending
+            except requests.exceptions.RequestException as req_err:
+                print(f"Fehler beim Lesen des Jenkins-Logs: {req_err}", file=sys.stderr)
+                raise
+
+    async def get_console_log_async(self, session: "aiohttp.ClientSession") -> Union[str, bytes, mmap.mmap, None]:
+        """
+        Ruft das Console-Log asynchron über eine aiohttp-Session ab,
+        damit mehrere Builds parallel geladen werden können.
+        Ist das Log lokal vorhanden, wird es stattdessen als mmap zurückgegeben.
+        Gibt None zurück, wenn das Log nicht abgerufen werden konnte.
+        """
+        local_log = self._open_local_log()
+        if local_log is not None:
+            return local_log
+
+        try:
+            async with session.get(
+                self._console_url(),
+                auth=aiohttp.BasicAuth(self.user, self.token),
+                timeout=aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+            ) as response:
+                response.raise_for_status()
+                return await response.text(encoding="utf-8", errors="replace")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+            print(f"Fehler beim Abrufen des Jenkins-Logs (Build #{self.build_number}): {req_err}", file=sys.stderr)
+            return None
 
 
 class LogParser:
     """
     Extrahiert und filtert relevante Fehlermeldungen im Build-Log.
     """
-    def __init__(self, raw_log: str):
+    def __init__(self, raw_log: Union[str, bytes, mmap.mmap, Iterable[str]], max_lines: int = 0,
+                 max_chars: int = 12000):
+        """
+        raw_log: komplettes Console-Log als String, UTF-8-bytes bzw. mmap
+                 oder zeilenweise als Iterable
+        max_lines: Anzahl der letzten Log-Zeilen, die unabhängig von
+                   Fehlerschlagwörtern als Kontext mitgenommen werden
+        max_chars: maximale Länge des Ergebnisses (ca. 4 Zeichen pro Token),
+                   0 schaltet die Kürzung ab
+        """
         self.raw_log = raw_log
+        self.max_lines = max_lines
+        self.max_chars = max_chars
 
     def extract_errors(self) -> str:
         """
         Durchsucht das gesamte Log nach typischen Fehlerschlagwörtern
         und filtert vertrauliche Daten (z. B. Passwords).
+        Die letzten max_lines Zeilen werden immer übernommen.
+        """
+        if isinstance(self.raw_log, str):
+            relevant_lines = self._extract_from_text(self.raw_log)
+        elif isinstance(self.raw_log, (bytes, mmap.mmap)):
+            relevant_lines = self._extract_from_bytes(self.raw_log)
+        else:
+            relevant_lines = self._extract_from_lines(self.raw_log)
+        return self._truncate(relevant_lines)
+
+    def _truncate(self, lines: list) -> str:
+        """
+        Kürzt das Ergebnis auf max_chars Zeichen. Behalten werden das erste
+        Viertel und die letzten drei Viertel, da Fehler meist am Ende stehen.
         """
-        error_lines = []
-        error_pattern = re.compile(r"(error|exception|failed|traceback)", re.IGNORECASE)
+        if self.max_chars <= 0 or sum(len(line) + 1 for line in lines) <= self.max_chars:
+            return "\n".join(lines)
+
+        head_budget = self.max_chars // 4
+        tail_budget = self.max_chars - head_budget
+
+        head = []
+        used = 0
+        for line in lines:
+            if used + len(line) + 1 > head_budget:
+                break
+            head.append(line)
+            used += len(line) + 1
+        rest = lines[len(head):]
+
+        # Passt nicht einmal die erste Zeile, wenigstens deren Anfang behalten
+        if not head and head_budget > 0:
+            head = [lines[0][:head_budget]]
+            rest = lines[1:]
+
+        tail = []
+        used = 0
+        for line in reversed(rest):
+            if used + len(line) + 1 > tail_budget:
+                break
+            tail.append(line)
+            used += len(line) + 1
+        tail.reverse()
 
-        for line in self.raw_log.splitlines():
-            if error_pattern.search(line):
-                # Beispiel-Filtern vertraulicher Daten
-                line = re.sub(r"(password|token)\S*", "[REDACTED]", line, flags=re.IGNORECASE)
-                error_lines.append(line.strip())
+        # Passt nicht einmal die letzte Zeile, wenigstens deren Ende behalten
+        if not tail:
+            tail = [lines[-1][-tail_budget:]]
 
-        return "\n".join(error_lines)
+        return "\n".join(head + ["... [truncated] ..."] + tail)
+
+    def _extract_from_text(self, text: str) -> list:
+        # Auf bytes arbeiten, damit die Suche nach Fehlerschlagwörtern
+        # komplett im C-Code der Regex-Engine läuft
+        return self._extract_from_bytes(text.encode("utf-8", errors="replace"))
+
+    def _extract_from_bytes(self, raw: Union[bytes, mmap.mmap]) -> list:
+        # Beginn der letzten Zeilen als Offset bestimmen, statt das
+        # komplette Log in eine Zeilenliste aufzuteilen
+        tail_start = _tail_offset(raw, self.max_lines)
+
+        # Ein linearer Durchlauf: nächstes Schlagwort suchen, auf die umgebende
+        # Zeile erweitern und hinter dieser Zeile weitersuchen. Zeilen ohne
+        # Treffer werden dabei nie als eigene Objekte angelegt.
+        relevant_lines = []
+        pos = 0
+        while True:
+            match = _ERROR_BYTES_RE.search(raw, pos, tail_start)
+            if match is None:
+                break
+            line_start = raw.rfind(b"\n", 0, match.start()) + 1
+            line_end = raw.find(b"\n", match.end(), tail_start)
+            if line_end == -1:
+                line_end = tail_start
+            pos = line_end + 1
+
+            # Das Schlagwort kann auch nur in einer ConsoleNote stehen, daher
+            # nach dem Entfernen der Notes erneut prüfen
+            line = _strip_console_notes(raw[line_start:line_end].decode("utf-8", errors="replace"))
+            filtered = _filter_error_line(line)
+            if filtered is not None:
+                relevant_lines.append(filtered)
+
+        tail = raw[tail_start:].decode("utf-8", errors="replace")
+        if tail:
+            for line in tail.removesuffix("\n").split("\n"):
+                relevant_lines.append(_redact_secrets(_strip_console_notes(line)).strip())
+        return relevant_lines
+
+    def _extract_from_lines(self, lines: Iterable[str]) -> list:
+        # Ein Durchlauf: die letzten max_lines Zeilen bleiben in der deque,
+        # nur herausfallende Zeilen werden auf Fehlerschlagwörter geprüft
+        relevant_lines = []
+        tail = deque()
+        for line in lines:
+            if self.max_lines > 0:
+                tail.append(line)
+                if len(tail) <= self.max_lines:
+                    continue
+                line = tail.popleft()
+
+            filtered = _filter_error_line(line)
+            if filtered is not None:
+                relevant_lines.append(filtered)
+
+        for line in tail:
+            relevant_lines.append(_redact_secrets(line).strip())
+        return relevant_lines
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """
+    Liest die Wartezeit in Sekunden aus Retry-After bzw. x-ratelimit-reset-requests.
+    Gibt None zurück, wenn keiner der Header auswertbar ist.
+    """
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            seconds = float(retry_after)
+        except ValueError:
+            seconds = math.nan
+        # float() akzeptiert auch "nan" und "inf", die time.sleep nicht verarbeiten kann
+        if math.isfinite(seconds):
+            return max(seconds, 0.0)
+
+    reset = headers.get("x-ratelimit-reset-requests")
+    if reset:
+        parts = _RESET_DURATION_RE.findall(reset)
+        if parts:
+            seconds = sum(float(value) * _RESET_UNITS[unit] for value, unit in parts)
+            if math.isfinite(seconds):
+                return seconds
+    return None
+
+
+class RateLimitError(Exception):
+    """
+    Die OpenAI API hat mit 429 geantwortet.
+    retry_after: vom Server vorgegebene Wartezeit in Sekunden (None, falls unbekannt)
+    """
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__(f"Rate-Limit der OpenAI API erreicht (Retry-After: {retry_after})")
+        self.retry_after = retry_after
+
+
+class AnalysisCache:
+    """
+    Speichert OpenAI-Analysen lokal, damit identische Fehler
+    (z. B. bei wiederholten Builds) nicht erneut analysiert werden.
+    """
+    def __init__(self, cache_dir: str = os.path.expanduser("~/.cache/jenkinsllm")):
+        self.cache_dir = cache_dir
+
+    def _cache_path(self, error_text: str, context: str) -> str:
+        # Nur der Schlüssel wird normalisiert, an OpenAI geht weiterhin der Originaltext.
+        # context (Modell, Prompt-Version) trennt Analysen verschiedener Konfigurationen.
+        cache_key = context + "\0" + _normalize_for_cache(error_text)
+        digest = hashlib.blake2b(cache_key.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.txt")
+
+    def get(self, error_text: str, context: str) -> Optional[str]:
+        """
+        Gibt die gespeicherte Analyse zurück oder None, falls keine vorhanden ist.
+        """
+        cache_path = self._cache_path(error_text, context)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, encoding="utf-8") as cache_file:
+                return cache_file.read()
+        except OSError:
+            return None
+
+    def put(self, error_text: str, context: str, analysis: str):
+        """
+        Speichert die Analyse atomar (erst temporäre Datei, dann umbenennen).
+        """
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                tmp_file.write(analysis)
+            os.replace(tmp_path, self._cache_path(error_text, context))
+        except OSError as os_err:
+            print(f"Konnte Analyse nicht im Cache speichern: {os_err}", file=sys.stderr)
+            # Keine halb geschriebenen .tmp-Dateien zurücklassen
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
 
 
 class OpenAIClient:
@@ -71,47 +579,224 @@ class OpenAIClient:
     Kommuniziert mit der OpenAI API:
     - Liest den API-Key aus dem Environment
     - Sendet die Fehlermeldungen zur Analyse
+    - Nutzt optional einen lokalen Cache für bereits analysierte Fehler
     """
-    def __init__(self):
+    # Ab dieser Länge des Fehlertexts wird das größere Modell verwendet
+    LARGE_MODEL_THRESHOLD = 8000
+    # Bei Änderungen an _SYSTEM_MSG oder _PROMPT_PREFIX erhöhen, damit der Cache neu befüllt wird
+    PROMPT_VERSION = 1
+
+    # Prompt-Bausteine einmalig anlegen, pro Anfrage wird nur der Fehlertext eingesetzt
+    _SYSTEM_MSG = {"role": "system", "content": "Du bist ein DevOps-Experte, der Fehlerlogs analysiert."}
+    _PROMPT_PREFIX = (
+        "Analysiere den folgenden Build-Log-Auszug. "
+        "Identifiziere mögliche Ursachen, Fehlerquellen und mache Vorschläge zur Behebung:\n\n"
+    )
+
+    def __init__(self, cache: Optional[AnalysisCache] = None):
+        self.cache = cache
+        # Kleines, schnelles Modell für die meisten Logs, großes nur für umfangreiche Auszüge
+        self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        self.large_model = os.getenv("OPENAI_LARGE_MODEL", "gpt-4o")
         self.api_key = os.getenv("OPENAI_API_KEY")
-        self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.api_base = "https://api.openai.com/v1"
+        self.api_url = f"{self.api_base}/chat/completions"
         if not self.api_key:
             raise ValueError("Umgebungsvariable OPENAI_API_KEY ist nicht gesetzt.")
-
-    def analyze_errors(self, error_text: str) -> str:
-        """
-        Sendet den Fehlertext an die OpenAI API und gibt die Analyse zurück.
-        """
-        headers = {
+        self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
 
-        # Prompt definieren
-        prompt_message = (
-            "Analysiere den folgenden Build-Log-Auszug. "
-            "Identifiziere mögliche Ursachen, Fehlerquellen und mache Vorschläge zur Behebung:\n\n"
-            f"{error_text}\n\n"
-        )
+    def _select_model(self, error_text: str) -> str:
+        """
+        Wählt das Modell passend zur Länge des Fehlertexts.
+        """
+        return self.large_model if len(error_text) > self.LARGE_MODEL_THRESHOLD else self.model
+
+    def _cache_context(self, model: str) -> str:
+        """
+        Teil des Cache-Schlüssels, der von Modell und Prompt abhängt.
+        """
+        return f"{model}|prompt-v{self.PROMPT_VERSION}"
+
+    def _build_payload(self, error_text: str, model: Optional[str] = None) -> dict:
+        """
+        Baut den Request-Body für /v1/chat/completions.
+        model: fest vorgegebenes Modell, sonst Auswahl nach Textlänge
+        """
+        if model is None:
+            model = self._select_model(error_text)
 
         payload = {
-            "model": "gpt-3.5-turbo",
+            "model": model,
             "messages": [
-                {"role": "system", "content": "Du bist ein DevOps-Experte, der Fehlerlogs analysiert."},
-                {"role": "user", "content": prompt_message}
+                self._SYSTEM_MSG,
+                {"role": "user", "content": self._PROMPT_PREFIX + error_text + "\n\n"}
             ],
             "temperature": 0.0
         }
+        return payload
+
+    def _request_analysis(self, payload: dict) -> str:
+        """
+        Schickt den Payload an /v1/chat/completions und gibt die Antwort zurück.
+        Wirft RateLimitError bei 429, damit der Aufrufer passend warten kann.
+        """
+        response = _session().post(self.api_url, headers=self.headers, data=_json_dumps(payload), timeout=30)
+        if response.status_code == 429:
+            raise RateLimitError(_parse_retry_after(response.headers))
+        response.raise_for_status()
+        response_data = _json_loads(response.content)
+        return response_data["choices"][0]["message"]["content"]
+
+    def analyze_errors(self, error_text: str, retries: int = 5) -> str:
+        """
+        Sendet den Fehlertext an die OpenAI API und gibt die Analyse zurück.
+        Liegt für denselben Fehlertext bereits eine Analyse im Cache, wird sie verwendet.
+        Bei Rate-Limits wird bis zu retries-mal erneut angefragt, so lange wie
+        vom Server vorgegeben bzw. mit exponentiell steigender Wartezeit (max. 60 s).
+        """
+        model = self._select_model(error_text)
+        if self.cache is not None:
+            cached = self.cache.get(error_text, self._cache_context(model))
+            if cached is not None:
+                return cached
+
+        payload = self._build_payload(error_text, model)
+
+        attempt = 0
+        while True:
+            try:
+                analysis = self._request_analysis(payload)
+                break
+            except RateLimitError as rate_err:
+                if attempt >= retries:
+                    return f"Fehler bei der Anfrage an die OpenAI API: {rate_err}"
+                delay = rate_err.retry_after if rate_err.retry_after is not None else 2 ** attempt
+                time.sleep(min(delay, 60))
+                attempt += 1
+            except requests.exceptions.RequestException as req_err:
+                return f"Fehler bei der Anfrage an die OpenAI API: {req_err}"
+            except (KeyError, ValueError):
+                return "Unerwartete Antwortstruktur von der OpenAI API erhalten."
+
+        if self.cache is not None:
+            self.cache.put(error_text, self._cache_context(model), analysis)
+        return analysis
+
+    def analyze_errors_batch(self, error_texts: list, poll_interval: int = 30) -> list:
+        """
+        Sendet mehrere Fehlertexte gesammelt über die OpenAI Batch API
+        (halber Preis, Ergebnis innerhalb von 24h) und gibt die Analysen
+        in derselben Reihenfolge zurück. Bereits gecachte Analysen werden
+        nicht erneut angefragt.
+        """
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        results = [None] * len(error_texts)
+        pending = []
+        for index, error_text in enumerate(error_texts):
+            if self.cache is not None:
+                results[index] = self.cache.get(error_text, self._cache_context(self._select_model(error_text)))
+            if results[index] is None:
+                pending.append(index)
+        if not pending:
+            return results
+
+        # Die Batch API erlaubt nur ein Modell pro Eingabedatei: das große Modell,
+        # sobald einer der Fehlertexte es benötigt
+        if any(len(error_texts[index]) > self.LARGE_MODEL_THRESHOLD for index in pending):
+            model = self.large_model
+        else:
+            model = self.model
+
+        # Eine JSONL-Zeile pro Build, custom_id ist der Index in error_texts
+        batch_lines = [
+            _json_dumps({
+                "custom_id": str(index),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._build_payload(error_texts[index], model)
+            })
+            for index in pending
+        ]
+        batch_file = b"\n".join(batch_lines)
+
+        def fail_pending(message: str) -> list:
+            for index in pending:
+                results[index] = message
+            return results
 
         try:
-            response = requests.post(self.api_url, headers=headers, data=json.dumps(payload), timeout=30)
+            # 1) Eingabedatei hochladen
+            response = _session().post(
+                f"{self.api_base}/files",
+                headers=headers,
+                data={"purpose": "batch"},
+                files={"file": ("batch.jsonl", batch_file, "application/jsonl")},
+                timeout=60
+            )
             response.raise_for_status()
-            response_data = response.json()
-            return response_data["choices"][0]["message"]["content"]
+            input_file_id = _json_loads(response.content)["id"]
+
+            # 2) Batch anlegen
+            response = _session().post(
+                f"{self.api_base}/batches",
+                headers=headers,
+                json={
+                    "input_file_id": input_file_id,
+                    "endpoint": "/v1/chat/completions",
+                    "completion_window": "24h"
+                },
+                timeout=30
+            )
+            response.raise_for_status()
+            batch = _json_loads(response.content)
+
+            # 3) Warten, bis der Batch abgeschlossen ist
+            while batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+                time.sleep(poll_interval)
+                response = _session().get(f"{self.api_base}/batches/{batch['id']}", headers=headers, timeout=30)
+                response.raise_for_status()
+                batch = _json_loads(response.content)
+
+            if batch["status"] != "completed":
+                return fail_pending(f"OpenAI-Batch wurde nicht abgeschlossen (Status: {batch['status']}).")
+
+            # 4) Ergebnisse und ggf. Fehler einzelner Anfragen einsammeln
+            for index in pending:
+                results[index] = "Keine Antwort im OpenAI-Batch erhalten."
+            for file_key in ("output_file_id", "error_file_id"):
+                file_id = batch.get(file_key)
+                if not file_id:
+                    continue
+                response = _session().get(f"{self.api_base}/files/{file_id}/content", headers=headers, timeout=60)
+                response.raise_for_status()
+                for line in response.content.splitlines():
+                    if line.strip():
+                        index, result, success = self._parse_batch_result(_json_loads(line))
+                        results[index] = result
+                        if success and self.cache is not None:
+                            self.cache.put(error_texts[index], self._cache_context(model), result)
+            return results
         except requests.exceptions.RequestException as req_err:
-            return f"Fehler bei der Anfrage an die OpenAI API: {req_err}"
-        except KeyError:
-            return "Unerwartete Antwortstruktur von der OpenAI API erhalten."
+            return fail_pending(f"Fehler bei der Anfrage an die OpenAI Batch API: {req_err}")
+        except (KeyError, ValueError):
+            return fail_pending("Unerwartete Antwortstruktur von der OpenAI Batch API erhalten.")
+
+    @staticmethod
+    def _parse_batch_result(entry: dict) -> tuple:
+        """
+        Wertet eine Zeile der Batch-Ausgabedatei aus und gibt
+        (Index, Analyse oder Fehlermeldung, Erfolg) zurück.
+        """
+        index = int(entry["custom_id"])
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code") != 200:
+            error = entry.get("error") or response.get("body", {}).get("error")
+            return index, f"Fehler bei der Anfrage an die OpenAI API: {error}", False
+        return index, response["body"]["choices"][0]["message"]["content"], True
 
 
 class BuildAnalyzer:
@@ -122,22 +807,54 @@ class BuildAnalyzer:
     3. OpenAIClient analysiert das Ganze
     4. Ausgabe erfolgt im stdout
     """
-    def __init__(self, jenkins_base_url: str, job_name: str, build_number: str, jenkins_user: str, jenkins_token: str):
+    def __init__(self, jenkins_base_url: str, job_name: str, build_number: str, jenkins_user: str, jenkins_token: str,
+                 max_lines: int = 0, max_chars: int = 12000, use_cache: bool = True):
+        self.jenkins_base_url = jenkins_base_url
+        self.job_name = job_name
+        self.jenkins_user = jenkins_user
+        self.jenkins_token = jenkins_token
+        self.max_lines = max_lines
+        self.max_chars = max_chars
         self.log_fetcher = JenkinsLogFetcher(jenkins_base_url, job_name, build_number, jenkins_user, jenkins_token)
-        self.openai_client = OpenAIClient()
+        self.openai_client = OpenAIClient(AnalysisCache() if use_cache else None)
 
-    def run_analysis(self):
-        # 1) Log abrufen
-        raw_log = self.log_fetcher.get_console_log()
-        if not raw_log:
-            print("Konnte kein Log abrufen. Abbruch.")
-            return
+    def _parse_log(self, raw_log: Union[str, bytes, mmap.mmap, Iterable[str], None]
+                   ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Extrahiert die relevanten Fehler aus dem abgerufenen Log.
+        Gibt (Fehlertext, None) zurück oder (None, Meldung), wenn nichts
+        an OpenAI geschickt werden muss.
+        """
+        if raw_log is None:
+            return None, "Konnte kein Log abrufen. Abbruch."
 
-        # 2) Relevante Fehler extrahieren
-        parser = LogParser(raw_log)
-        error_text = parser.extract_errors()
+        parser = LogParser(raw_log, self.max_lines, self.max_chars)
+        try:
+            error_text = parser.extract_errors()
+        except requests.exceptions.RequestException:
+            # Download abgebrochen: ein Teil-Log darf weder analysiert noch gecacht werden
+            return None, "Konnte kein Log abrufen. Abbruch."
+        finally:
+            if isinstance(raw_log, mmap.mmap):
+                raw_log.close()
         if not error_text:
-            print("Keine relevanten Fehler im abgerufenen Log gefunden.")
+            return None, "Keine relevanten Fehler im abgerufenen Log gefunden."
+        return error_text, None
+
+    def _extract_error_text(self, raw_log: Union[str, bytes, mmap.mmap, Iterable[str], None]) -> Optional[str]:
+        """
+        Wie _parse_log, gibt die Meldung aber direkt aus.
+        """
+        error_text, message = self._parse_log(raw_log)
+        if message is not None:
+            print(message)
+        return error_text
+
+    def run_analysis(self):
+        # 1) Log abrufen und 2) relevante Fehler extrahieren
+        raw_log = self.log_fetcher.get_console_log()
+        error_text = self._extract_error_text(raw_log)
+        if error_text is None:
             return
 
         # 3) An OpenAI senden
@@ -146,28 +863,142 @@ class BuildAnalyzer:
         # 4) Direkt auf stdout ausgeben
         print(analysis_result)
 
+    def run_analysis_many(self, build_numbers: list):
+        """
+        Analysiert mehrere Builds desselben Jobs einzeln über die normale API.
+        Abruf und Parsing des nächsten Logs laufen in einem eigenen Thread,
+        während die OpenAI-Anfrage für den vorherigen Build noch läuft.
+        """
+        error_queue = queue.Queue()
+        # Kopfzeile und Inhalt werden gemeinsam unter dem Lock ausgegeben,
+        # damit sich die Ausgaben beider Threads nicht vermischen
+        print_lock = threading.Lock()
+
+        def produce():
+            try:
+                for build_number in build_numbers:
+                    log_fetcher = JenkinsLogFetcher(
+                        self.jenkins_base_url, self.job_name, build_number, self.jenkins_user, self.jenkins_token
+                    )
+                    error_text, message = self._parse_log(log_fetcher.get_console_log())
+                    if error_text is not None:
+                        error_queue.put((build_number, error_text))
+                    else:
+                        with print_lock:
+                            print(f"=== Build #{build_number} ===\n{message}")
+            finally:
+                # Ende signalisieren, auch wenn der Abruf abbricht
+                error_queue.put(None)
+
+        def consume():
+            while True:
+                item = error_queue.get()
+                if item is None:
+                    return
+                build_number, error_text = item
+                analysis_result = self.openai_client.analyze_errors(error_text)
+                with print_lock:
+                    print(f"=== Analyse Build #{build_number} ===\n{analysis_result}")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            producer = executor.submit(produce)
+            consumer = executor.submit(consume)
+            producer.result()
+            consumer.result()
+
+    def run_analysis_batch(self, build_numbers: list):
+        """
+        Analysiert mehrere Builds desselben Jobs gesammelt über die
+        OpenAI Batch API. Gedacht für nicht-interaktive Läufe (z. B. nächtlich).
+        Ist aiohttp installiert, werden die Logs parallel abgerufen.
+        """
+        log_fetchers = [
+            JenkinsLogFetcher(self.jenkins_base_url, self.job_name, build_number, self.jenkins_user, self.jenkins_token)
+            for build_number in build_numbers
+        ]
+        if aiohttp is not None:
+            raw_logs = asyncio.run(self._fetch_console_logs(log_fetchers))
+        else:
+            # Ohne aiohttp nacheinander abrufen, jeweils erst wenn das Log gebraucht wird
+            raw_logs = (log_fetcher.get_console_log() for log_fetcher in log_fetchers)
+
+        builds = []
+        error_texts = []
+        for build_number, raw_log in zip(build_numbers, raw_logs):
+            print(f"=== Build #{build_number} ===")
+            error_text = self._extract_error_text(raw_log)
+            if error_text is not None:
+                builds.append(build_number)
+                error_texts.append(error_text)
+
+        if not error_texts:
+            return
+
+        analysis_results = self.openai_client.analyze_errors_batch(error_texts)
+        for build_number, analysis_result in zip(builds, analysis_results):
+            print(f"=== Analyse Build #{build_number} ===")
+            print(analysis_result)
+
+    @staticmethod
+    async def _fetch_console_logs(log_fetchers: list) -> list:
+        """
+        Ruft die Logs aller Builds parallel ab (höchstens 10 gleichzeitige Verbindungen).
+        """
+        connector = aiohttp.TCPConnector(limit=10, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await asyncio.gather(
+                *(log_fetcher.get_console_log_async(session) for log_fetcher in log_fetchers)
+            )
+
 
 def main():
+    arg_parser = argparse.ArgumentParser(description="Analysiert fehlgeschlagene Jenkins-Builds mit OpenAI.")
+    arg_parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Mehrere Builds (FAILED_BUILD_NUMBER kommasepariert) über die OpenAI Batch API analysieren"
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Lokalen Cache ignorieren und immer neu bei OpenAI anfragen"
+    )
+    args = arg_parser.parse_args()
+
     # Jenkins-Basis-URL, z. B. 'https://jenkins.meinefirma.com'
     jenkins_base_url = os.getenv("JENKINS_BASE_URL")
     # Parameter aus Jenkins Pipeline B (z.B. "MeinJob")
     failed_job_name = os.getenv("FAILED_JOB_NAME")
-    # Buildnummer (z.B. "42")
+    # Buildnummer (z.B. "42", für mehrere Builds auch "40,41,42")
     failed_build_number = os.getenv("FAILED_BUILD_NUMBER")
+    build_numbers = [b.strip() for b in (failed_build_number or "").split(",") if b.strip()]
 
     # Für Basic Auth bei Jenkins:
     jenkins_user = os.getenv("JENKINS_USER", "")
     jenkins_token = os.getenv("JENKINS_API_TOKEN", "")
 
     try:
+        # Anzahl der letzten Log-Zeilen, die immer mitgeschickt werden
+        max_lines = int(os.getenv("LOG_TAIL_LINES", "0"))
+        # Obergrenze für den an OpenAI geschickten Log-Auszug (0 = unbegrenzt)
+        max_chars = int(os.getenv("LOG_MAX_CHARS", "12000"))
+
         analyzer = BuildAnalyzer(
             jenkins_base_url,
             failed_job_name,
-            failed_build_number,
+            build_numbers[0] if build_numbers else failed_build_number,
             jenkins_user,
-            jenkins_token
+            jenkins_token,
+            max_lines,
+            max_chars,
+            use_cache=not args.no_cache
         )
-        analyzer.run_analysis()
+        if args.batch:
+            analyzer.run_analysis_batch(build_numbers)
+        elif len(build_numbers) > 1:
+            analyzer.run_analysis_many(build_numbers)
+        else:
+            analyzer.run_analysis()
     except ValueError as e:
         print(f"Konfigurationsfehler: {e}", file=sys.stderr)
     except Exception as e: